@@ -0,0 +1,582 @@
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import random
+import secrets
+import time
+import os
+from collections import defaultdict, deque
+
+# BLAS/OpenMP backends read these when their shared libraries load, so
+# they must be set before any third-party import; this also covers
+# sklearn/scipy pools created during the lazy model load, which
+# threadpool_limits at startup cannot see.
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, field_validator
+import joblib
+import numpy as np
+import onnxruntime as ort
+import redis.asyncio as aioredis
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+from cachetools import TTLCache
+from threadpoolctl import threadpool_limits
+
+app = FastAPI(
+    title="EndoPredict AI API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+# FastAPI's default validation-error response echoes the offending
+# input through the stdlib json encoder, which raises on NaN/inf — so
+# a non-finite /predict payload turned into a 500 instead of the 422
+# the features validator intends. orjson renders non-finite floats as
+# null, letting the 422 actually reach the client.
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    return ORJSONResponse(
+        status_code=422,
+        content={"detail": jsonable_encoder(exc.errors())},
+    )
+
+# Single-row inference gains nothing from BLAS/OpenMP fanning out one
+# thread per core, and with several uvicorn workers that oversubscribes
+# the CPU and hurts tail latency. threadpool_limits only registers
+# pools in libraries that are already loaded, so it is applied again
+# after the lazy model load in _ensure_model.
+_threadpool_limiter = None
+
+
+@app.on_event("startup")
+async def limit_native_threads():
+    global _threadpool_limiter
+    _threadpool_limiter = threadpool_limits(limits=1)
+
+
+# ================= MODEL LOADING =================
+#
+# Artifacts are loaded lazily on the first /predict call instead of at
+# import, so worker startup stays fast for OTP-only workloads and
+# unpickling the sklearn estimator is paid only when needed.
+
+model = None
+scaler = None
+
+# Preferred: an ONNX export of the model (convert offline with skl2onnx,
+# zipmap disabled so probabilities come back as a plain array). The C++
+# runtime is faster on small batches than the pickled sklearn estimator
+# and avoids pickle's deserialization attack surface.
+onnx_session = None
+onnx_input_name = None
+
+# Cached scaler statistics so standardization can be done with in-place
+# numpy ops instead of going through scaler.transform (which allocates a
+# new array and re-validates its input on every call).
+MEAN = None
+SCALE = None
+N_FEATS = None
+
+# For linear models the scaler folds algebraically into the weights:
+# sigmoid(coef @ ((x - mean) / scale) + b) == sigmoid(w @ x + b') with
+# w = coef / scale and b' = b - sum(coef * mean / scale). That lets the
+# batcher skip standardization and predict_proba entirely.
+FOLDED_COEF = None
+FOLDED_INTERCEPT = None
+
+_model_loaded = False
+_load_lock = asyncio.Lock()
+
+
+async def _ensure_model():
+    global model, scaler, onnx_session, onnx_input_name
+    global MEAN, SCALE, N_FEATS, FOLDED_COEF, FOLDED_INTERCEPT, _model_loaded
+    global _threadpool_limiter
+
+    if _model_loaded:
+        return
+
+    async with _load_lock:
+        if _model_loaded:
+            return
+
+        if os.path.exists("model.onnx"):
+            session = ort.InferenceSession(
+                "model.onnx", providers=["CPUExecutionProvider"]
+            )
+            outputs = session.get_outputs()
+            # skl2onnx's default (zipmap enabled) emits probabilities as
+            # a sequence of dicts the batcher cannot index; only accept
+            # the plain tensor that a zipmap=False export produces.
+            if len(outputs) >= 2 and outputs[1].type == "tensor(float)":
+                onnx_session = session
+                onnx_input_name = session.get_inputs()[0].name
+            else:
+                print(
+                    "WARNING: model.onnx probabilities are not a plain tensor "
+                    "(re-export with zipmap disabled); falling back to pcos_model.pkl."
+                )
+
+        if onnx_session is None:
+            try:
+                # mmap the estimator's arrays so the OS can share the
+                # pages across uvicorn workers instead of each worker
+                # materializing its own copy.
+                model = joblib.load("pcos_model.pkl", mmap_mode="r")
+            except FileNotFoundError:
+                print("WARNING: pcos_model.pkl not found. Predictions will return mock data.")
+
+        try:
+            scaler = joblib.load("scaler.pkl", mmap_mode="r")
+        except FileNotFoundError:
+            print("WARNING: scaler.pkl not found.")
+
+        if scaler is not None:
+            MEAN = scaler.mean_.astype(np.float32)
+            SCALE = scaler.scale_.astype(np.float32)
+            N_FEATS = MEAN.shape[0]
+
+        if model is not None and scaler is not None and hasattr(model, "coef_"):
+            FOLDED_COEF = (model.coef_ / scaler.scale_).astype(np.float32)
+            FOLDED_INTERCEPT = (
+                model.intercept_
+                - (model.coef_ * scaler.mean_ / scaler.scale_).sum(axis=1)
+            ).astype(np.float32)
+
+        # Loading the artifacts may have pulled in new BLAS/OpenMP
+        # libraries; cap their pools too.
+        _threadpool_limiter = threadpool_limits(limits=1)
+
+        _model_loaded = True
+
+# Micro-batching: concurrent /predict calls are collected for a few
+# milliseconds and run through predict_proba as one batch, which
+# amortizes sklearn's per-call overhead across all waiting requests.
+BATCH_WINDOW_SECONDS = 0.005
+
+_pending: list[tuple[list[float], asyncio.Future]] = []
+
+
+async def _batcher():
+    while True:
+        await asyncio.sleep(BATCH_WINDOW_SECONDS)
+        if not _pending:
+            continue
+
+        batch = _pending[:]
+        _pending.clear()
+
+        # A failing batch must neither kill this loop (which would hang
+        # every later /predict) nor strand its own callers: on error the
+        # batch's futures get the exception so each request returns 500.
+        try:
+            X = np.asarray([features for features, _ in batch], dtype=np.float32)
+            if FOLDED_COEF is not None:
+                z = X @ FOLDED_COEF.T + FOLDED_INTERCEPT
+                probs = 1.0 / (1.0 + np.exp(-z[:, 0]))
+            elif onnx_session is not None:
+                np.subtract(X, MEAN, out=X)
+                np.divide(X, SCALE, out=X)
+                probs = onnx_session.run(None, {onnx_input_name: X})[1][:, 1]
+            else:
+                np.subtract(X, MEAN, out=X)
+                np.divide(X, SCALE, out=X)
+                probs = model.predict_proba(X)[:, 1]
+        except Exception as exc:
+            print("PREDICTION BATCH FAILED:", exc)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(
+                        HTTPException(status_code=500, detail="Prediction failed")
+                    )
+            continue
+
+        for (_, fut), prob in zip(batch, probs):
+            if not fut.done():
+                fut.set_result(float(prob))
+
+
+# The event loop only keeps weak references to tasks, so each
+# background task is held in a module-level variable to keep it from
+# being garbage-collected mid-flight.
+_batcher_task = None
+
+
+@app.on_event("startup")
+async def start_batcher():
+    global _batcher_task
+    _batcher_task = asyncio.create_task(_batcher())
+
+
+# Clients frequently re-submit the same form values (retries, back
+# button); memoizing by feature vector skips the model entirely.
+pred_cache = TTLCache(maxsize=10_000, ttl=300)
+
+class PredictionRequest(BaseModel):
+    features: list[float]
+
+    # The batch path feeds the model's C routines directly (folded
+    # weights / in-place standardization), so NaN/inf screening that
+    # sklearn's check_array used to do has to happen here instead.
+    @field_validator("features")
+    @classmethod
+    def _features_finite(cls, v):
+        if not v:
+            raise ValueError("features must not be empty")
+        if not all(math.isfinite(x) for x in v):
+            raise ValueError("features must be finite numbers")
+        return v
+
+class PredictionResponse(BaseModel):
+    risk_percentage: float
+
+@app.post("/predict", response_model=PredictionResponse)
+async def predict(request: PredictionRequest):
+    await _ensure_model()
+
+    if (model is None and onnx_session is None) or scaler is None:
+        return PredictionResponse(
+            risk_percentage=random.uniform(5.0, 85.0)
+        )
+
+    if len(request.features) != N_FEATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Expected {N_FEATS} features, got {len(request.features)}",
+        )
+
+    key = hashlib.blake2b(
+        np.asarray(request.features, dtype=np.float32).tobytes(), digest_size=16
+    ).digest()
+    cached = pred_cache.get(key)
+    if cached is not None:
+        return PredictionResponse(risk_percentage=cached)
+
+    fut = asyncio.get_running_loop().create_future()
+    _pending.append((request.features, fut))
+    probability = await fut
+
+    risk = round(probability * 100, 2)
+    pred_cache[key] = risk
+    return PredictionResponse(risk_percentage=risk)
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy"}
+
+# ================= OTP SECTION =================
+
+otp_store = {}
+users_db = {}
+OTP_EXPIRY_SECONDS = 300
+MAX_HISTORY_PER_USER = 1000
+
+# Expired OTPs were previously only dropped if their owner called
+# /auth/verify-otp; abandoned entries accumulated forever. A periodic
+# sweep keeps the store bounded.
+OTP_GC_INTERVAL_SECONDS = 60
+
+
+async def _otp_gc():
+    while True:
+        await asyncio.sleep(OTP_GC_INTERVAL_SECONDS)
+        now = time.time()
+        expired = [email for email, rec in otp_store.items() if rec["expires_at"] < now]
+        for email in expired:
+            otp_store.pop(email, None)
+
+
+_otp_gc_task = None
+
+
+@app.on_event("startup")
+async def start_otp_gc():
+    global _otp_gc_task
+    _otp_gc_task = asyncio.create_task(_otp_gc())
+
+
+ph = PasswordHasher()
+
+# Successful verifies are remembered briefly so repeat logins within
+# the window skip the (deliberately expensive) argon2 work.
+VERIFY_CACHE_TTL_SECONDS = 60
+verify_cache = TTLCache(maxsize=10_000, ttl=VERIFY_CACHE_TTL_SECONDS)
+
+# Newest-first per-user history; maxlen bounds memory per user and
+# appendleft keeps reads copy-free (no [::-1] reversal on every GET).
+history_db = defaultdict(lambda: deque(maxlen=MAX_HISTORY_PER_USER))
+
+# When REDIS_URL is set, users and history live in Redis so they survive
+# restarts and are shared across uvicorn workers. Without it the app
+# falls back to the in-process dicts above (single-worker dev setup).
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = aioredis.from_url(REDIS_URL) if REDIS_URL else None
+
+if redis_client is None:
+    print("WARNING: REDIS_URL not set. Users and history are in-memory only.")
+
+
+async def store_user(email: str, name: str, password: str):
+    if redis_client is not None:
+        await redis_client.hset(
+            f"user:{email}", mapping={"name": name, "password": password}
+        )
+    else:
+        users_db[email] = {"name": name, "email": email, "password": password}
+
+
+async def get_user(email: str):
+    if redis_client is not None:
+        data = await redis_client.hgetall(f"user:{email}")
+        if not data:
+            return None
+        return {
+            "name": data[b"name"].decode(),
+            "email": email,
+            "password": data[b"password"].decode(),
+        }
+    return users_db.get(email)
+
+
+async def store_history_entry(email: str, entry: dict):
+    if redis_client is not None:
+        key = f"hist:{email}"
+        await redis_client.lpush(key, json.dumps(entry))
+        await redis_client.ltrim(key, 0, MAX_HISTORY_PER_USER - 1)
+    else:
+        history_db[email].appendleft(entry)
+
+
+async def fetch_history(email: str, limit: int, offset: int):
+    if redis_client is not None:
+        raw = await redis_client.lrange(f"hist:{email}", offset, offset + limit - 1)
+        return [json.loads(item) for item in raw]
+    history = history_db.get(email)
+    if not history:
+        return []
+    # Entries are stored newest-first, so a plain islice is the page.
+    return list(itertools.islice(history, offset, offset + limit))
+
+class OTPRequest(BaseModel):
+    email: str
+    name: str
+    password: str | None = None
+
+class OTPVerify(BaseModel):
+    email: str
+    otp: str
+    password: str
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
+
+class GoogleLogin(BaseModel):
+    token: str
+    email: str
+    name: str
+
+
+# Shared async HTTP client so every OTP send reuses one connection pool
+# instead of paying a fresh TLS handshake per request.
+email_client = httpx.AsyncClient(timeout=10.0)
+
+
+@app.on_event("shutdown")
+async def close_email_client():
+    await email_client.aclose()
+
+
+# Static parts of the Resend request, built once at import; per send
+# only the recipient, name, and OTP are filled in.
+RESEND_API_KEY = os.getenv("RESEND_API_KEY")
+
+EMAIL_HEADERS = {
+    "Authorization": f"Bearer {RESEND_API_KEY}",
+    "Content-Type": "application/json",
+}
+EMAIL_FROM = "onboarding@resend.dev"
+EMAIL_SUBJECT = "Your Secure Access Code - EndoPredict AI"
+
+OTP_HTML_TMPL = """
+    <h2>Hello %s,</h2>
+    <p>Your OTP is:</p>
+    <h1 style="letter-spacing:5px;">%s</h1>
+    <p>This code expires in 5 minutes.</p>
+"""
+
+# Handlers enqueue (to_email, name, otp); a single long-lived worker
+# drains the queue over the shared client, so send failures never
+# bubble into a request and sends reuse one connection.
+email_queue = asyncio.Queue()
+
+
+# ✅ RESEND EMAIL FUNCTION
+async def send_email(to_email: str, name: str, otp: str):
+    response = await email_client.post(
+        "https://api.resend.com/emails",
+        headers=EMAIL_HEADERS,
+        json={
+            "from": EMAIL_FROM,
+            "to": [to_email],
+            "subject": EMAIL_SUBJECT,
+            "html": OTP_HTML_TMPL % (name, otp),
+        },
+    )
+
+    print("RESEND STATUS:", response.status_code)
+    print("RESEND RESPONSE:", response.text)
+
+
+async def _email_worker():
+    while True:
+        to_email, name, otp = await email_queue.get()
+        try:
+            await send_email(to_email, name, otp)
+        except httpx.HTTPError as exc:
+            print("EMAIL SEND FAILED:", exc)
+        finally:
+            email_queue.task_done()
+
+
+_email_worker_task = None
+
+
+@app.on_event("startup")
+async def start_email_worker():
+    global _email_worker_task
+    _email_worker_task = asyncio.create_task(_email_worker())
+
+
+@app.post("/auth/send-otp")
+async def send_otp(req: OTPRequest):
+    # Fail the request up front when no email can ever be delivered,
+    # instead of reporting success and dropping the send in the worker.
+    if not RESEND_API_KEY:
+        print("❌ RESEND_API_KEY is not set in environment variables")
+        raise HTTPException(status_code=500, detail="Email service not configured")
+
+    otp = f"{secrets.randbelow(900_000) + 100_000:06d}"
+    expires_at = time.time() + OTP_EXPIRY_SECONDS
+
+    # Store only a hash of the OTP so the plaintext never sits in memory.
+    otp_store[req.email] = {
+        "otp_hash": hashlib.sha256(otp.encode()).digest(),
+        "expires_at": expires_at,
+        "name": req.name,
+    }
+
+    # Deliver the email from the worker task so the client is not stuck
+    # waiting on the Resend round-trip.
+    email_queue.put_nowait((req.email, req.name, otp))
+
+    return {"status": "success", "message": "OTP sent successfully"}
+
+
+@app.post("/auth/verify-otp")
+async def verify_otp(req: OTPVerify):
+    record = otp_store.get(req.email)
+
+    if not record:
+        raise HTTPException(status_code=400, detail="OTP not found or expired")
+
+    if time.time() > record["expires_at"]:
+        del otp_store[req.email]
+        raise HTTPException(status_code=400, detail="OTP expired")
+
+    submitted_hash = hashlib.sha256(req.otp.encode()).digest()
+    if not hmac.compare_digest(record["otp_hash"], submitted_hash):
+        raise HTTPException(status_code=400, detail="Invalid OTP")
+
+    name = record["name"]
+    del otp_store[req.email]
+
+    await store_user(req.email, name, ph.hash(req.password))
+
+    return {
+        "status": "success",
+        "token": f"mock-jwt-token-{req.email}",
+        "user": {"email": req.email, "name": name},
+    }
+
+
+@app.post("/auth/login")
+async def login_user(req: LoginRequest):
+    user = await get_user(req.email)
+
+    if not user:
+        raise HTTPException(status_code=400, detail="Account not found.")
+
+    cache_key = (req.email, hashlib.sha256(req.password.encode()).digest())
+
+    if cache_key not in verify_cache:
+        try:
+            ph.verify(user["password"], req.password)
+        except VerifyMismatchError:
+            raise HTTPException(status_code=400, detail="Incorrect password.")
+        verify_cache[cache_key] = True
+
+    return {
+        "status": "success",
+        "token": f"mock-jwt-token-{req.email}",
+        "user": {"email": user["email"], "name": user["name"]},
+    }
+
+
+@app.post("/auth/google")
+async def google_login(req: GoogleLogin):
+    return {
+        "status": "success",
+        "token": f"mock-jwt-google-{req.email}",
+        "user": {"email": req.email, "name": req.name},
+    }
+
+
+# ================= HISTORY =================
+
+class HistoryItemRequest(BaseModel):
+    email: str
+    risk_percentage: float
+    date: str
+
+@app.post("/history")
+async def save_history(req: HistoryItemRequest):
+    await store_history_entry(req.email, {
+        "risk_percentage": req.risk_percentage,
+        "date": req.date,
+    })
+
+    return {"status": "success", "message": "History saved"}
+
+
+@app.get("/history/{email}")
+async def get_history(
+    email: str,
+    limit: int = Query(50, ge=1),
+    offset: int = Query(0, ge=0),
+):
+    return {
+        "status": "success",
+        "history": await fetch_history(email, limit, offset),
+    }
\ No newline at end of file